@@ -27,6 +27,47 @@ except ImportError:
     )
 
 
+class CUDAPrefetcher:
+    """
+    Iterate over a dataloader, while copying the next batch to the GPU on a separate CUDA stream,
+    so that host-to-device transfers overlap with the processing of the current batch.
+    """
+
+    def __init__(self, dataloader, device):
+        """
+        Parameters
+        ----------
+        dataloader : :py:class:`~torch.utils.data.DataLoader`
+            Dataloader returning tuples of tensors, ideally with ``pin_memory=True``.
+        device : :py:class:`~torch.device`
+            CUDA device to copy batches to.
+        """
+        self.dataloader = dataloader
+        self.device = device
+
+    def __len__(self):
+        return len(self.dataloader)
+
+    def __iter__(self):
+        stream = torch.cuda.Stream(device=self.device)
+        current_batch = None
+        for batch in self.dataloader:
+            with torch.cuda.stream(stream):
+                batch = [x.to(self.device, non_blocking=True) for x in batch]
+            if current_batch is not None:
+                yield current_batch
+
+            # make compute stream wait for the copy, without blocking the host
+            compute_stream = torch.cuda.current_stream(self.device)
+            compute_stream.wait_stream(stream)
+            for x in batch:
+                x.record_stream(compute_stream)
+            current_batch = batch
+
+        if current_batch is not None:
+            yield current_batch
+
+
 def benchmark(
     model,
     dataset,
@@ -41,6 +82,9 @@ def benchmark(
     use_wandb=False,
     label=None,
     epoch=None,
+    num_workers=0,
+    prefetch_factor=None,
+    lpips_half_precision=False,
     **kwargs,
 ):
     """
@@ -68,6 +112,15 @@ def benchmark(
         If True, return the average value of the metrics, by default True.
     snr : float, optional
         Signal to noise ratio for adding shot noise. If None, no noise is added, by default None.
+    num_workers : int, optional
+        Number of worker processes for loading data, by default 0 (load in main process). Loading in
+        parallel overlaps file reading with reconstruction, but should only be used for datasets that
+        read from disk, e.g. not for datasets that simulate with a trainable mask or capture with hardware.
+    prefetch_factor : int, optional
+        Number of batches loaded in advance by each worker, by default None (PyTorch default). Only used if ``num_workers > 0``.
+    lpips_half_precision : bool, optional
+        If True and running on GPU, compute LPIPS metrics with float16 autocast, by default False.
+        Other metrics are always computed in float32.
 
     Returns
     -------
@@ -106,8 +159,26 @@ def benchmark(
             if key != "ReconstructionError":
                 metrics_values[key + "_unrolled"] = []
 
+    # LPIPS (VGG features) is by far the heaviest metric and is tolerant to half precision
+    lpips_autocast_kwargs = dict(
+        device_type=device.type,
+        dtype=torch.float16,
+        enabled=lpips_half_precision and device.type == "cuda",
+    )
+
     # loop over batches
-    dataloader = DataLoader(dataset, batch_size=batchsize, pin_memory=(device != "cpu"))
+    dataloader_kwargs = dict()
+    if num_workers > 0:
+        dataloader_kwargs["prefetch_factor"] = prefetch_factor
+    dataloader = DataLoader(
+        dataset,
+        batch_size=batchsize,
+        pin_memory=(device.type == "cuda"),
+        num_workers=num_workers,
+        **dataloader_kwargs,
+    )
+    if device.type == "cuda":
+        dataloader = CUDAPrefetcher(dataloader, device)
     model.reset()
     idx = 0
     with torch.no_grad():
@@ -115,7 +186,7 @@ def benchmark(
             if hasattr(dataset, "multimask"):
                 if dataset.multimask:
                     lensless, lensed, psfs = batch
-                    psfs = psfs.to(device)
+                    psfs = psfs.to(device, non_blocking=True)
                 else:
                     lensless, lensed = batch
                     psfs = None
@@ -123,8 +194,8 @@ def benchmark(
                 lensless, lensed = batch
                 psfs = None
 
-            lensless = lensless.to(device)
-            lensed = lensed.to(device)
+            lensless = lensless.to(device, non_blocking=True)
+            lensed = lensed.to(device, non_blocking=True)
 
             # add shot noise
             if snr is not None:
@@ -149,6 +220,7 @@ def benchmark(
             prediction_original = prediction.clone()
 
             # Convert to [N*D, C, H, W] for torchmetrics
+            # -- `movedim` returns a view with channels_last strides, so no copy is made here
             prediction = prediction.reshape(-1, *prediction.shape[-3:]).movedim(-1, -3)
             lensed = lensed.reshape(-1, *lensed.shape[-3:]).movedim(-1, -3)
 
@@ -206,29 +278,21 @@ def benchmark(
                         model.reconstruction_error(
                             prediction=prediction_original, lensless=lensless
                         )
-                        .cpu()
-                        .item()
                     )
                 else:
                     try:
                         if "LPIPS" in metric:
-                            if prediction.shape[1] == 1:
-                                # LPIPS needs 3 channels
-                                metrics_values[metric].append(
-                                    metrics[metric](
+                            with torch.autocast(**lpips_autocast_kwargs):
+                                if prediction.shape[1] == 1:
+                                    # LPIPS needs 3 channels
+                                    val = metrics[metric](
                                         prediction.repeat(1, 3, 1, 1), lensed.repeat(1, 3, 1, 1)
                                     )
-                                    .cpu()
-                                    .item()
-                                )
-                            else:
-                                metrics_values[metric].append(
-                                    metrics[metric](prediction, lensed).cpu().item()
-                                )
+                                else:
+                                    val = metrics[metric](prediction, lensed)
+                            metrics_values[metric].append(val.float())
                         else:
-                            metrics_values[metric].append(
-                                metrics[metric](prediction, lensed).cpu().item()
-                            )
+                            metrics_values[metric].append(metrics[metric](prediction, lensed))
                     except Exception as e:
                         print(f"Error in metric {metric}: {e}")
 
@@ -258,27 +322,28 @@ def benchmark(
                         continue
                     else:
                         if "LPIPS" in metric:
-                            if unrolled_out.shape[1] == 1:
-                                # LPIPS needs 3 channels
-                                metrics_values[metric].append(
-                                    metrics[metric](
+                            with torch.autocast(**lpips_autocast_kwargs):
+                                if unrolled_out.shape[1] == 1:
+                                    # LPIPS needs 3 channels
+                                    val = metrics[metric](
                                         unrolled_out.repeat(1, 3, 1, 1), lensed.repeat(1, 3, 1, 1)
                                     )
-                                    .cpu()
-                                    .item()
-                                )
-                            else:
-                                metrics_values[metric + "_unrolled"].append(
-                                    metrics[metric](unrolled_out, lensed).cpu().item()
-                                )
+                                else:
+                                    val = metrics[metric](unrolled_out, lensed)
+                            metrics_values[metric + "_unrolled"].append(val.float())
                         else:
                             metrics_values[metric + "_unrolled"].append(
-                                metrics[metric](unrolled_out, lensed).cpu().item()
+                                metrics[metric](unrolled_out, lensed)
                             )
 
             model.reset()
             idx += batchsize
 
+    # transfer to CPU at the end, to avoid synchronizing with the device at every batch
+    for key in metrics_values:
+        if len(metrics_values[key]) > 0:
+            metrics_values[key] = torch.stack(metrics_values[key]).cpu().tolist()
+
     # average metrics
     if return_average:
         for metric in metrics:
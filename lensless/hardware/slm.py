@@ -7,12 +7,12 @@
 
 
 import os
+import functools
+import cv2
 import numpy as np
 from lensless.hardware.utils import check_username_hostname
 from lensless.utils.io import get_ctypes
 from slm_controller.hardware import SLMParam, slm_devices
-from scipy.ndimage import rotate as rotate_func
-
 
 try:
     import torch
@@ -161,8 +161,6 @@ def get_programmable_mask(
     # -- prepare SLM mask
     n_active_slm_pixels = vals.shape
     n_color_filter = np.prod(slm_param["color_filter"].shape[:2])
-    pixel_pitch = slm_param[SLMParam_wp.PITCH]
-    centers = get_centers(n_active_slm_pixels, pixel_pitch=pixel_pitch)
 
     if color_filter is None and SLMParam_wp.COLOR_FILTER in slm_param.keys():
         color_filter = slm_param[SLMParam_wp.COLOR_FILTER]
@@ -180,36 +178,29 @@ def get_programmable_mask(
         else:
             raise ValueError("color_filter must be numpy array or torch tensor")
 
-    d1 = sensor.pitch
-    _height_pixel, _width_pixel = (slm_param[SLMParam_wp.CELL_SIZE] / d1).astype(int)
+    # -- sensor pixels covered by each cell, only depends on the geometry
+    rows, cols, cell_idx, color_filter_idx = _get_cell_pixels(
+        n_active_slm_pixels=tuple(n_active_slm_pixels),
+        pixel_pitch=tuple(slm_param[SLMParam_wp.PITCH]),
+        cell_size=tuple(slm_param[SLMParam_wp.CELL_SIZE]),
+        sensor_pitch=tuple(sensor.pitch),
+        sensor_resolution=tuple(sensor.resolution),
+        n_color_filter=n_color_filter,
+        device=vals.device if use_torch else None,
+    )
 
     if use_torch:
-        mask = torch.zeros((n_color_filter,) + tuple(sensor.resolution)).to(vals)
+        mask = torch.zeros(
+            (n_color_filter,) + tuple(sensor.resolution), dtype=dtype, device=vals.device
+        )
         slm_vals_flat = vals.flatten()
     else:
         mask = np.zeros((n_color_filter,) + tuple(sensor.resolution), dtype=dtype)
         slm_vals_flat = vals.reshape(-1)
 
-    for i, _center in enumerate(centers):
-
-        _center_pixel = (_center / d1 + sensor.resolution / 2).astype(int)
-        _center_top_left_pixel = (
-            _center_pixel[0] - np.floor(_height_pixel / 2).astype(int),
-            _center_pixel[1] + 1 - np.floor(_width_pixel / 2).astype(int),
-        )
-
-        color_filter_idx = i // n_active_slm_pixels[1] % n_color_filter
-
-        mask_val = slm_vals_flat[i] * color_filter[color_filter_idx][0]
-        if isinstance(mask_val, np.ndarray):
-            mask_val = mask_val[:, np.newaxis, np.newaxis]
-        elif isinstance(mask_val, torch.Tensor):
-            mask_val = mask_val.unsqueeze(-1).unsqueeze(-1)
-        mask[
-            :,
-            _center_top_left_pixel[0] : _center_top_left_pixel[0] + _height_pixel,
-            _center_top_left_pixel[1] : _center_top_left_pixel[1] + _width_pixel,
-        ] = mask_val
+    # -- value of each cell, shape (n_cells, n_channels)
+    mask_vals = slm_vals_flat[:, None] * color_filter[color_filter_idx, 0]
+    mask[:, rows, cols] = mask_vals[cell_idx].T
 
     # # quantize mask
     # if use_torch:
@@ -222,13 +213,93 @@ def get_programmable_mask(
     # rotate
     if rotate is not None:
         if use_torch:
+            # runs with `grid_sample` on the device of the mask
             mask = transforms.functional.rotate(mask, angle=rotate)
         else:
-            mask = rotate_func(mask, axes=(2, 1), angle=rotate, reshape=False)
+            # OpenCV is much faster than `scipy.ndimage.rotate`, bicubic only supports up to 4 channels
+            # -- values differ from SciPy's cubic spline (by less than 0.1 for a mask in [0, 1]),
+            # and more along the border of the rotated mask, where OpenCV interpolates with zeros
+            height, width = mask.shape[-2:]
+            rot_mat = cv2.getRotationMatrix2D(((width - 1) / 2, (height - 1) / 2), rotate, 1.0)
+            mask = np.stack(
+                [
+                    cv2.warpAffine(_mask, rot_mat, (width, height), flags=cv2.INTER_CUBIC)
+                    for _mask in mask
+                ]
+            )
 
     return mask
 
 
+@functools.lru_cache(maxsize=8)
+def _get_cell_pixels(
+    n_active_slm_pixels,
+    pixel_pitch,
+    cell_size,
+    sensor_pitch,
+    sensor_resolution,
+    n_color_filter,
+    device=None,
+):
+    """
+    Get sensor pixels covered by each SLM cell, and the color filter index of each cell.
+
+    Cached as the geometry doesn't change between calls, e.g. when training the mask values.
+    If ``device`` is not ``None``, torch tensors on that device are returned.
+    """
+    sensor_pitch = np.array(sensor_pitch)
+    sensor_resolution = np.array(sensor_resolution)
+    centers = get_centers(n_active_slm_pixels, pixel_pitch=np.array(pixel_pitch))
+    _height_pixel, _width_pixel = (np.array(cell_size) / sensor_pitch).astype(int)
+
+    # -- top left pixel of each SLM cell
+    n_cells = len(centers)
+    centers_pixel = (centers / sensor_pitch + sensor_resolution / 2).astype(int)
+    top_left_pixel = centers_pixel - np.array(
+        [np.floor(_height_pixel / 2), np.floor(_width_pixel / 2) - 1]
+    ).astype(int)
+
+    # -- start and stop of each cell, normalized as when slicing
+    cell_shape = np.array([_height_pixel, _width_pixel])
+    start = _normalize_slice_idx(top_left_pixel, sensor_resolution)
+    stop = _normalize_slice_idx(top_left_pixel + cell_shape, sensor_resolution)
+
+    # -- sensor pixels covered by each cell
+    rows = start[:, 0, np.newaxis, np.newaxis] + np.arange(_height_pixel)[:, np.newaxis]
+    cols = start[:, 1, np.newaxis, np.newaxis] + np.arange(_width_pixel)
+    rows, cols = np.broadcast_arrays(rows, cols)
+    cell_idx = np.broadcast_to(np.arange(n_cells)[:, np.newaxis, np.newaxis], rows.shape)
+    stop = stop[:, :, np.newaxis, np.newaxis]
+    valid = (rows < stop[:, 0]) & (cols < stop[:, 1])
+    rows, cols, cell_idx = rows[valid], cols[valid], cell_idx[valid]
+
+    # -- cells with negative start wrap around as when slicing, and can overlap with other cells:
+    # keep last cell for each pixel (as when setting cells one after the other), so that each pixel
+    # is only set once and overwritten cells get no gradient
+    pixel_idx = rows * sensor_resolution[1] + cols
+    _, last_rev = np.unique(pixel_idx[::-1], return_index=True)
+    last = len(pixel_idx) - 1 - last_rev
+    rows, cols, cell_idx = rows[last], cols[last], cell_idx[last]
+
+    color_filter_idx = np.arange(n_cells) // n_active_slm_pixels[1] % n_color_filter
+
+    if device is not None:
+        rows = torch.from_numpy(rows).to(device)
+        cols = torch.from_numpy(cols).to(device)
+        cell_idx = torch.from_numpy(cell_idx).to(device)
+        color_filter_idx = torch.from_numpy(color_filter_idx).to(device)
+
+    return rows, cols, cell_idx, color_filter_idx
+
+
+def _normalize_slice_idx(idx, length):
+    """
+    Normalize (possibly negative) indices to the range [0, length], as done when slicing.
+    """
+    idx = np.where(idx < 0, idx + length, idx)
+    return np.clip(idx, 0, length)
+
+
 def adafruit_sub2full(
     subpattern,
     center,
@@ -310,12 +381,6 @@ def get_intensity_psf(
         device = mask.device
 
     dtype = mask.dtype
-    ctype, _ = get_ctypes(dtype, is_torch)
-
-    if is_torch:
-        psfs = torch.zeros(mask.shape, dtype=ctype, device=device)
-    else:
-        psfs = np.zeros(mask.shape, dtype=ctype)
 
     if waveprop:
 
@@ -340,25 +405,97 @@ def get_intensity_psf(
         )
         u_in = spherical_wavefront * mask
 
-        # free space propagation to sensor
-        for i, wv in enumerate(color_system.wv):
-            psfs[i], _, _ = angular_spectrum(
-                u_in=u_in[i],
-                wv=wv,
-                d1=sensor.pitch,
-                dz=mask2sensor,
-                dtype=dtype,
-                device=device,
-            )
+        # free space propagation to sensor, all wavelengths at once
+        psfs = _angular_spectrum_batch(
+            u_in=u_in,
+            wv=color_system.wv,
+            d1=sensor.pitch,
+            dz=mask2sensor,
+            dtype=dtype,
+            device=device,
+        )
 
+        # -- intensity PSF
+        if is_torch:
+            psf_in = torch.square(torch.abs(psfs))
+        else:
+            psf_in = np.square(np.abs(psfs))
+
+    else:
+
+        # -- shadow of real-valued mask
+        psf_in = mask * mask
+
+    return psf_in
+
+
+def _angular_spectrum_batch(u_in, wv, d1, dz, dtype, device=None):
+    """
+    Free space propagation with the angular spectrum method, as done by
+    :py:func:`waveprop.rs.angular_spectrum`, but for a batch of fields (one per wavelength along
+    the first dimension) with a single FFT.
+    """
+    is_torch = torch_available and isinstance(u_in, torch.Tensor)
+    Ny, Nx = u_in.shape[-2:]
+
+    # transfer function for each wavelength
+    H_args = ((Ny, Nx), tuple(d1), tuple(wv), dz, dtype, device if is_torch else None)
+    if is_torch and isinstance(dz, torch.Tensor):
+        H = _get_transfer_functions.__wrapped__(*H_args)
     else:
+        H = _get_transfer_functions(*H_args)
 
-        psfs = mask
+    # zero-pad to linearize convolution, as `waveprop.util.zero_pad`
+    pad_y, pad_x = Ny // 2, Nx // 2
+    pad_top, pad_left = pad_y + Ny % 2, pad_x + Nx % 2
 
-    # -- intensity PSF
+    # scaling factors of `waveprop.util.ft2` and `waveprop.util.ift2` cancel out
     if is_torch:
-        psf_in = torch.square(torch.abs(psfs))
+        u_in_pad = torch.nn.functional.pad(u_in, (pad_left, pad_x, pad_top, pad_y))
+        U1 = torch.fft.fftshift(
+            torch.fft.fft2(torch.fft.fftshift(u_in_pad, dim=(-2, -1))), dim=(-2, -1)
+        )
+        u_out = torch.fft.ifftshift(
+            torch.fft.ifft2(torch.fft.ifftshift(H * U1, dim=(-2, -1))), dim=(-2, -1)
+        )
     else:
-        psf_in = np.square(np.abs(psfs))
+        ctype, _ = get_ctypes(dtype, is_torch)
+        u_in_pad = np.pad(u_in, pad_width=((0, 0), (pad_top, pad_y), (pad_left, pad_x)))
+        U1 = np.fft.fftshift(np.fft.fft2(np.fft.fftshift(u_in_pad, axes=(-2, -1))), axes=(-2, -1))
+        u_out = np.fft.ifftshift(
+            np.fft.ifft2(np.fft.ifftshift(H * U1, axes=(-2, -1))), axes=(-2, -1)
+        ).astype(ctype)
 
-    return psf_in
+    # remove padding
+    return u_out[..., Ny // 2 : Ny // 2 + Ny, Nx // 2 : Nx // 2 + Nx]
+
+
+@functools.lru_cache(maxsize=4)
+def _get_transfer_functions(shape, d1, wv, dz, dtype, device=None):
+    """
+    Get (padded) angular spectrum transfer function for each wavelength, stacked along the first
+    dimension.
+
+    Cached as they only depend on the geometry, e.g. not on the mask values when training.
+    """
+    if device is not None:
+        u_in = torch.zeros(shape, dtype=dtype, device=device)
+    else:
+        u_in = np.zeros(shape, dtype=dtype)
+
+    H = [
+        angular_spectrum(
+            u_in=u_in,
+            wv=_wv,
+            d1=list(d1),
+            dz=dz,
+            dtype=dtype,
+            device=device,
+            return_H=True,
+        )
+        for _wv in wv
+    ]
+    if device is not None:
+        return torch.stack(H)
+    else:
+        return np.stack(H)
@@ -346,7 +346,28 @@ mask_type_to_class = {
 }
 
 
-def prep_trainable_mask(config, psf=None, downsample=None):
+def prep_trainable_mask(config, psf=None, downsample=None, initial_mask=None):
+    """
+    Create trainable mask object from (training) configuration.
+
+    Parameters
+    ----------
+    config : dict
+        Configuration, with ``trainable_mask`` and ``files`` sections.
+    psf : :py:class:`~torch.Tensor`, optional
+        PSF, used if initial value of mask is ``"psf"`` or ``"random"``.
+    downsample : int, optional
+        Downsampling factor. Default is ``config["files"]["downsample"]``.
+    initial_mask : :py:class:`~torch.Tensor`, optional
+        Initial mask values, e.g. from a trained model, instead of the initial value specified in
+        the configuration (which is then not created). Not used if the initial value is a mask
+        configuration.
+
+    Returns
+    -------
+    :py:class:`~lensless.hardware.trainable_mask.TrainableMask`
+        Trainable mask object, or None if no trainable mask in configuration.
+    """
 
     mask = None
     color_filter = None
@@ -377,51 +398,52 @@ def prep_trainable_mask(config, psf=None, downsample=None):
 
         else:
 
-            if config["trainable_mask"]["initial_value"] == "random":
-                if psf is not None:
-                    initial_mask = torch.rand_like(psf)
-                else:
-                    sensor = VirtualSensor.from_name(
-                        config["simulation"]["sensor"], downsample=downsample
+            if initial_mask is None:
+                if config["trainable_mask"]["initial_value"] == "random":
+                    if psf is not None:
+                        initial_mask = torch.rand_like(psf)
+                    else:
+                        sensor = VirtualSensor.from_name(
+                            config["simulation"]["sensor"], downsample=downsample
+                        )
+                        resolution = sensor.resolution
+                        initial_mask = torch.rand((1, *resolution, 3))
+
+                elif config["trainable_mask"]["initial_value"] == "psf":
+                    initial_mask = psf.clone()
+
+                # if file ending with "npy"
+                elif config["trainable_mask"]["initial_value"].endswith("npy"):
+
+                    pattern = np.load(config["trainable_mask"]["initial_value"])
+
+                    initial_mask = full2subpattern(
+                        pattern=pattern,
+                        shape=config["trainable_mask"]["ap_shape"],
+                        center=config["trainable_mask"]["ap_center"],
+                        slm=config["trainable_mask"]["slm"],
                     )
-                    resolution = sensor.resolution
-                    initial_mask = torch.rand((1, *resolution, 3))
-
-            elif config["trainable_mask"]["initial_value"] == "psf":
-                initial_mask = psf.clone()
+                    initial_mask = torch.from_numpy(initial_mask.astype(np.float32))
 
-            # if file ending with "npy"
-            elif config["trainable_mask"]["initial_value"].endswith("npy"):
+                    # prepare color filter if needed
+                    from waveprop.devices import slm_dict
+                    from waveprop.devices import SLMParam as SLMParam_wp
 
-                pattern = np.load(config["trainable_mask"]["initial_value"])
+                    slm_param = slm_dict[config["trainable_mask"]["slm"]]
+                    if (
+                        config["trainable_mask"]["train_color_filter"]
+                        and SLMParam_wp.COLOR_FILTER in slm_param.keys()
+                    ):
+                        color_filter = slm_param[SLMParam_wp.COLOR_FILTER]
+                        color_filter = torch.from_numpy(color_filter.copy()).to(dtype=torch.float32)
 
-                initial_mask = full2subpattern(
-                    pattern=pattern,
-                    shape=config["trainable_mask"]["ap_shape"],
-                    center=config["trainable_mask"]["ap_center"],
-                    slm=config["trainable_mask"]["slm"],
-                )
-                initial_mask = torch.from_numpy(initial_mask.astype(np.float32))
+                        # TODO: add small random values?
+                        color_filter = color_filter + 0.1 * torch.rand_like(color_filter)
 
-                # prepare color filter if needed
-                from waveprop.devices import slm_dict
-                from waveprop.devices import SLMParam as SLMParam_wp
-
-                slm_param = slm_dict[config["trainable_mask"]["slm"]]
-                if (
-                    config["trainable_mask"]["train_color_filter"]
-                    and SLMParam_wp.COLOR_FILTER in slm_param.keys()
-                ):
-                    color_filter = slm_param[SLMParam_wp.COLOR_FILTER]
-                    color_filter = torch.from_numpy(color_filter.copy()).to(dtype=torch.float32)
-
-                    # TODO: add small random values?
-                    color_filter = color_filter + 0.1 * torch.rand_like(color_filter)
-
-            else:
-                raise ValueError(
-                    f"Initial PSF value {config['trainable_mask']['initial_value']} not supported"
-                )
+                else:
+                    raise ValueError(
+                        f"Initial PSF value {config['trainable_mask']['initial_value']} not supported"
+                    )
 
             # convert to grayscale if needed
             if config["trainable_mask"]["grayscale"] and not is_grayscale(initial_mask):
@@ -8,6 +8,11 @@ and other intermediate files. Models are stored on Hugging Face.
 
 
 import os
+import copy
+import json
+import functools
+import fnmatch
+import inspect
 import numpy as np
 import torch
 from lensless.recon.utils import create_process_network
@@ -18,9 +23,24 @@ import yaml
 from huggingface_hub import snapshot_download
 from collections import OrderedDict
 
+try:
+    # LibYAML bindings, much faster than the pure-Python loader
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 
 model_dir_path = os.path.join(os.path.dirname(__file__), "..", "..", "models")
 
+# file written in model directory after a complete download
+DOWNLOAD_MARKER = ".download_complete"
+
+# files needed by `load_model`, checked before writing the download marker
+MODEL_FILES = (os.path.join(".hydra", "config.yaml"), "recon_epochBEST")
+
+# memory-mapping of checkpoints requires torch >= 2.1
+TORCH_LOAD_MMAP = "mmap" in inspect.signature(torch.load).parameters
+
 model_dict = {
     "diffusercam": {
         "mirflickr": {
@@ -99,7 +119,89 @@ def remove_data_parallel(old_state_dict):
     return new_state_dict
 
 
-def download_model(camera, dataset, model, local_model_dir=None):
+def _load_config(model_path):
+    """
+    Load Hydra config of a model. Cached, as a model may be loaded several times, e.g. for
+    benchmarking.
+    """
+    config_path = os.path.join(model_path, ".hydra", "config.yaml")
+    return _load_config_cached(config_path, os.path.getmtime(config_path))
+
+
+@functools.lru_cache(maxsize=8)
+def _load_config_cached(config_path, mtime):
+    # modification time is part of the cache key, so that a modified file is loaded again
+    with open(config_path, "r") as stream:
+        return yaml.load(stream, Loader=SafeLoader)
+
+
+def _load_learned_psf(model_path):
+    """
+    Load best PSF of a model trained with :py:class:`~lensless.hardware.trainable_mask.TrainablePSF`.
+    Cached, returned array should not be modified in-place.
+    """
+    psf_path = os.path.join(model_path, "psf_epochBEST.npy")
+    return _load_learned_psf_cached(psf_path, os.path.getmtime(psf_path))
+
+
+@functools.lru_cache(maxsize=8)
+def _load_learned_psf_cached(psf_path, mtime):
+    # modification time is part of the cache key, so that a modified file is loaded again
+    return np.load(psf_path)
+
+
+def _prefetch_file(fp):
+    """
+    Ask the OS to start reading a file into the page cache, e.g. before memory-mapping it, so that
+    it is not read page by page on first access. No-op where not supported (e.g. not Linux).
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(fp, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+
+def _create_empty_process_network(network, depth, nc, device):
+    """
+    Create process network without initializing its weights, as they are loaded from a checkpoint.
+
+    Weights are allocated (uninitialized) directly on ``device``, i.e. without a first allocation
+    and random initialization on CPU.
+    """
+    if network == "DruNet":
+        # pre-trained weights are loaded from file
+        process, _ = create_process_network(network=network, depth=depth, nc=nc, device=device)
+    else:
+        with torch.device("meta"):
+            process, _ = create_process_network(network=network, depth=depth, nc=nc, device="meta")
+        if process is not None:
+            process = process.to_empty(device=device)
+    return process
+
+
+def _read_download_marker(marker_fp):
+    """
+    Read marker of a complete download, returning None if there is none (or it is invalid).
+    """
+    try:
+        with open(marker_fp, "r") as f:
+            marker = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(marker, dict) or "allow_patterns" not in marker:
+        return None
+    return marker
+
+
+def download_model(
+    camera, dataset, model, local_model_dir=None, allow_patterns=(".hydra/*", "*epochBEST*")
+):
 
     """
     Download model from model_dict (if needed).
@@ -110,6 +212,11 @@ def download_model(camera, dataset, model, local_model_dir=None):
         Dataset used for training.
     model_name : str
         Name of model.
+    allow_patterns : tuple of str, optional
+        Patterns of files to download, by default the config and best checkpoint, namely what
+        :py:func:`~lensless.recon.model_dict.load_model` needs (and not the intermediate epochs).
+        Set to None to download the whole output folder. Files of a previous download with other
+        patterns are kept, and only missing files are downloaded.
     """
 
     if local_model_dir is None:
@@ -127,13 +234,44 @@ def download_model(camera, dataset, model, local_model_dir=None):
     repo_id = model_dict[camera][dataset][model]
     model_dir = os.path.join(local_model_dir, camera, dataset, model)
 
-    if not os.path.exists(model_dir):
-        snapshot_download(repo_id=repo_id, local_dir=model_dir)
+    # marker only written once download has completed, so that an interrupted download (which
+    # leaves a partial directory) is resumed on the next call
+    # -- it contains the patterns of downloaded files, to download more if broader ones are requested
+    marker_fp = os.path.join(model_dir, DOWNLOAD_MARKER)
+    marker = _read_download_marker(marker_fp)
+    if marker is not None and (
+        marker["allow_patterns"] is None
+        or (allow_patterns is not None and set(allow_patterns) <= set(marker["allow_patterns"]))
+    ):
+        return model_dir
+
+    snapshot_download(
+        repo_id=repo_id,
+        local_dir=model_dir,
+        allow_patterns=list(allow_patterns) if allow_patterns is not None else None,
+    )
+
+    # without connection, `snapshot_download` returns an existing (possibly partial) directory
+    for fn in MODEL_FILES:
+        requested = allow_patterns is None or any(
+            fnmatch.fnmatch(fn.replace(os.sep, "/"), pattern) for pattern in allow_patterns
+        )
+        if requested and not os.path.exists(os.path.join(model_dir, fn)):
+            raise FileNotFoundError(
+                f"Download of {repo_id} to {model_dir} is incomplete, {fn} is missing."
+            )
+
+    if allow_patterns is not None and marker is not None:
+        allow_patterns = set(allow_patterns) | set(marker["allow_patterns"])
+    with open(marker_fp, "w") as f:
+        json.dump(
+            {"allow_patterns": sorted(allow_patterns) if allow_patterns is not None else None}, f
+        )
 
     return model_dir
 
 
-def load_model(model_path, psf, device="cpu", legacy_denoiser=False, verbose=True):
+def load_model(model_path, psf, device="cpu", legacy_denoiser=False, verbose=True, dtype=None):
 
     """
     Load best model from model path.
@@ -146,77 +284,78 @@ def load_model(model_path, psf, device="cpu", legacy_denoiser=False, verbose=Tru
         PSF tensor.
     device : str
         Device to load model on.
+    dtype : :py:class:`torch.dtype`, optional
+        Data type of pre- and post-processing networks, e.g. ``torch.bfloat16`` for faster
+        inference on GPU. The unrolled algorithm (FFT-based) remains in float32. Default is to
+        keep the data type of the checkpoint.
     """
 
-    # load Hydra config
-    config_path = os.path.join(model_path, ".hydra", "config.yaml")
-    with open(config_path, "r") as stream:
-        config = yaml.safe_load(stream)
+    # load Hydra config, copy to not modify cached one
+    config = copy.deepcopy(_load_config(model_path))
 
     # load learning mask
     downsample = config["files"]["downsample"] * 4  # TODO: particular to DiffuserCam?
-    mask = prep_trainable_mask(config, psf, downsample=downsample)
-    if mask is not None:
-
-        if config["trainable_mask"]["mask_type"] == "TrainablePSF":
-            # print("loading best PSF...")
+    psf_learned = None
+    if config["trainable_mask"]["mask_type"] == "TrainablePSF":
+        # -- copy, as cached array would otherwise share memory with the model
+        psf_learned = torch.tensor(_load_learned_psf(model_path)).to(psf).unsqueeze(0)
 
-            psf_learned = np.load(os.path.join(model_path, "psf_epochBEST.npy"))
-            psf_learned = torch.Tensor(psf_learned).to(psf).unsqueeze(0)
-
-            # -- set values and get new PSF
-            with torch.no_grad():
-                mask._mask = torch.nn.Parameter(torch.tensor(psf_learned))
-                psf = mask.get_psf().to(device)
+    # -- initialize with learned values (if any), rather than those used for training
+    mask = prep_trainable_mask(config, psf, downsample=downsample, initial_mask=psf_learned)
+    if mask is not None and psf_learned is not None:
+        with torch.no_grad():
+            psf = mask.get_psf().to(device)
 
     # load best model config
     model_checkpoint = os.path.join(model_path, "recon_epochBEST")
     assert os.path.exists(model_checkpoint), "Checkpoint does not exist"
     if verbose:
         print("Loading checkpoint from : ", model_checkpoint)
-    model_state_dict = torch.load(model_checkpoint, map_location=device)
+    # memory-map checkpoint on CPU, tensors are only read when copied into the model (on `device`)
+    _prefetch_file(model_checkpoint)
+    load_kwargs = {"mmap": True} if TORCH_LOAD_MMAP else {}
+    model_state_dict = torch.load(model_checkpoint, map_location="cpu", **load_kwargs)
 
     # load model
+    rec_cfg = config["reconstruction"]
+    pre_cfg = rec_cfg["pre_process"]
+    post_cfg = rec_cfg["post_process"]
     pre_process = None
     post_process = None
 
-    if config["reconstruction"]["pre_process"]["network"] is not None:
+    if pre_cfg["network"] is not None:
 
-        pre_process, _ = create_process_network(
-            network=config["reconstruction"]["pre_process"]["network"],
-            depth=config["reconstruction"]["pre_process"]["depth"],
-            nc=config["reconstruction"]["pre_process"]["nc"]
-            if "nc" in config["reconstruction"]["pre_process"].keys()
-            else None,
+        pre_process = _create_empty_process_network(
+            network=pre_cfg["network"],
+            depth=pre_cfg["depth"],
+            nc=pre_cfg.get("nc"),
             device=device,
         )
 
-    if config["reconstruction"]["post_process"]["network"] is not None:
+    if post_cfg["network"] is not None:
 
-        post_process, _ = create_process_network(
-            network=config["reconstruction"]["post_process"]["network"],
-            depth=config["reconstruction"]["post_process"]["depth"],
-            nc=config["reconstruction"]["post_process"]["nc"]
-            if "nc" in config["reconstruction"]["post_process"].keys()
-            else None,
+        post_process = _create_empty_process_network(
+            network=post_cfg["network"],
+            depth=post_cfg["depth"],
+            nc=post_cfg.get("nc"),
             device=device,
         )
 
-    if config["reconstruction"]["method"] == "unrolled_admm":
+    if rec_cfg["method"] == "unrolled_admm":
         recon = UnrolledADMM(
             psf if mask is None else psf_learned,
             pre_process=pre_process,
             post_process=post_process,
-            n_iter=config["reconstruction"]["unrolled_admm"]["n_iter"],
-            skip_unrolled=config["reconstruction"]["skip_unrolled"],
+            n_iter=rec_cfg["unrolled_admm"]["n_iter"],
+            skip_unrolled=rec_cfg["skip_unrolled"],
             legacy_denoiser=legacy_denoiser,
         )
-    elif config["reconstruction"]["method"] == "trainable_inv":
+    elif rec_cfg["method"] == "trainable_inv":
         recon = TrainableInversion(
             psf,
             pre_process=pre_process,
             post_process=post_process,
-            K=config["reconstruction"]["trainable_inv"]["K"],
+            K=rec_cfg["trainable_inv"]["K"],
             legacy_denoiser=legacy_denoiser,
         )
 
@@ -224,7 +363,7 @@ def load_model(model_path, psf, device="cpu", legacy_denoiser=False, verbose=Tru
         psf_learned = torch.nn.Parameter(psf_learned)
         recon._set_psf(psf_learned)
 
-    if "device_ids" in config.keys() and config["device_ids"] is not None:
+    if config.get("device_ids") is not None:
         model_state_dict = remove_data_parallel(model_state_dict)
 
     # # return model_state_dict
@@ -234,4 +373,9 @@ def load_model(model_path, psf, device="cpu", legacy_denoiser=False, verbose=Tru
 
     recon.load_state_dict(model_state_dict)
 
+    if dtype is not None:
+        for process in [pre_process, post_process]:
+            if process is not None:
+                process.to(dtype=dtype)
+
     return recon
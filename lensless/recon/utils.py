@@ -129,7 +129,9 @@ def apply_denoiser(model, image, noise_level=10, mode="inference"):
         dim=1,
     )
 
-    # apply model
+    # apply model, in the data type of its weights (e.g. half precision for inference)
+    input_dtype = image.dtype
+    image = image.to(next(model.parameters()).dtype)
     if mode == "inference":
         with torch.no_grad():
             image = model(image)
@@ -137,6 +139,7 @@ def apply_denoiser(model, image, noise_level=10, mode="inference"):
         image = model(image)
     else:
         raise ValueError("mode must be 'inference' or 'train'")
+    image = image.to(input_dtype)
 
     # remove padding
     image = image[:, :, top:-bottom, left:-right]
@@ -9,7 +9,9 @@
 from hydra.utils import get_original_cwd
 import numpy as np
 import glob
+import hashlib
 import os
+import tempfile
 import torch
 from abc import abstractmethod
 from torch.utils.data import Dataset, Subset
@@ -89,6 +91,9 @@ class DualDataset(Dataset):
         if isinstance(indices, int):
             indices = range(indices)
         self.indices = indices
+        if background is not None:
+            # convert once, rather than mixing numpy and torch for every sample
+            background = torch.as_tensor(background, dtype=torch.float32).contiguous()
         self.background = background
         self.input_snr = input_snr
         self.downsample = downsample
@@ -162,7 +167,7 @@ class DualDataset(Dataset):
 
         if self.background is not None:
             lensless = lensless - self.background
-            lensless = torch.clamp(lensless, min=0)
+            lensless.clamp_(min=0)
 
         # add noise
         if self.input_snr is not None:
@@ -590,6 +595,8 @@ class MeasuredDataset(DualDataset):
         lensless_fn="diffuser",
         lensed_fn="lensed",
         image_ext="npy",
+        cache=False,
+        cache_dir=None,
         **kwargs,
     ):
         """
@@ -606,6 +613,14 @@ class MeasuredDataset(DualDataset):
             Name of the folder containing the lensed images, by default "lensed".
         image_ext : str, optional
             Extension of the images, by default "npy".
+        cache : bool, optional
+            If ``True`` and ``image_ext`` is "npy", the lensless and lensed images are stacked into a single
+            file per folder (created the first time), which is then memory-mapped
+            so that each sample is read without opening a new file, by default ``False``. All images
+            in a folder should have the same shape. A new cache file is created if the names, sizes
+            or modification times of the images change.
+        cache_dir : str, optional
+            Directory where to write the cache files, by default ``root_dir``.
         """
 
         super(MeasuredDataset, self).__init__(**kwargs)
@@ -626,6 +641,59 @@ class MeasuredDataset(DualDataset):
                 f"No files found in {self.lensless_dir} with extension {image_ext}"
             )
 
+        self.cache = cache and self.image_ext == "npy"
+        self.cache_dir = root_dir if cache_dir is None else cache_dir
+        if self.cache:
+            self.file_idx = {fn: i for i, fn in enumerate(self.files)}
+            self.lensless_cache_fp = self._build_cache(self.lensless_dir, lensless_fn)
+            self.lensed_cache_fp = self._build_cache(self.lensed_dir, lensed_fn)
+            # memory-maps are opened on first access, so that they are not copied to workers
+            self._lensless_cache = None
+            self._lensed_cache = None
+
+    def _build_cache(self, data_dir, name):
+        """
+        Stack all images of a folder into a single NPY file, if not already done.
+
+        The file name contains a hash of the folder path and of the names, sizes and modification
+        times of the images, so that modified images are not read from a stale cache.
+        """
+        file_hash = hashlib.sha1(os.path.abspath(data_dir).encode())
+        for fn in self.files:
+            stat = os.stat(os.path.join(data_dir, fn))
+            file_hash.update(f"{fn} {stat.st_size} {stat.st_mtime_ns}\n".encode())
+        cache_fp = os.path.join(self.cache_dir, f"{name}_cache_{file_hash.hexdigest()[:16]}.npy")
+        if os.path.exists(cache_fp):
+            return cache_fp
+
+        print(f"Caching {len(self.files)} files from {data_dir} to {cache_fp}...")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        first = np.load(os.path.join(data_dir, self.files[0]))
+
+        # write to unique temporary file, so that concurrent processes don't overwrite each other
+        fd, tmp_fp = tempfile.mkstemp(dir=self.cache_dir, prefix=f"{name}_cache_", suffix=".tmp")
+        os.close(fd)
+        try:
+            cache = np.lib.format.open_memmap(
+                tmp_fp, mode="w+", dtype=first.dtype, shape=(len(self.files),) + first.shape
+            )
+            for i, fn in enumerate(self.files):
+                cache[i] = np.load(os.path.join(data_dir, fn))
+            cache.flush()
+            del cache
+            os.replace(tmp_fp, cache_fp)
+        except BaseException:
+            os.remove(tmp_fp)
+            raise
+        return cache_fp
+
+    def _get_cached_pair(self, fn):
+        if self._lensless_cache is None:
+            self._lensless_cache = np.load(self.lensless_cache_fp, mmap_mode="r")
+            self._lensed_cache = np.load(self.lensed_cache_fp, mmap_mode="r")
+        i = self.file_idx[fn]
+        return np.array(self._lensless_cache[i]), np.array(self._lensed_cache[i])
+
     def __len__(self):
         if self.indices is None:
             return len(self.files)
@@ -633,6 +701,9 @@ class MeasuredDataset(DualDataset):
             return len([i for i in self.indices if i < len(self.files)])
 
     def _get_images_pair(self, idx):
+        if self.cache:
+            return self._get_cached_pair(self.files[idx])
+
         if self.image_ext == "npy" or self.image_ext == "npz":
             lensless_fp = os.path.join(self.lensless_dir, self.files[idx])
             lensed_fp = os.path.join(self.lensed_dir, self.files[idx])
@@ -727,6 +798,9 @@ class DiffuserCamMirflickr(MeasuredDataset):
         assert idx <= self.allowed_idx.max(), f"idx should be <= {self.allowed_idx.max()}"
 
         fn = f"im{idx}.npy"
+        if self.cache:
+            return self._get_cached_pair(fn)
+
         lensless_fp = os.path.join(self.lensless_dir, fn)
         lensed_fp = os.path.join(self.lensed_dir, fn)
         lensless = np.load(lensless_fp)
@@ -745,6 +819,8 @@ class DiffuserCamTestDataset(MeasuredDataset):
         data_dir=None,
         n_files=None,
         downsample=2,
+        cache=False,
+        cache_dir=None,
     ):
         """
         Dataset consisting of lensless and corresponding lensed image. Default parameters are for the test set of
@@ -758,6 +834,10 @@ class DiffuserCamTestDataset(MeasuredDataset):
             Number of image pairs to load in the dataset , by default use all.
         downsample : int, optional
             Downsample factor of the lensless images, by default 2. Note that the PSF has a resolution of 4x of the images.
+        cache : bool, optional
+            Whether to stack the images into a single memory-mapped file, see :py:class:`~lensless.utils.dataset.MeasuredDataset`.
+        cache_dir : str, optional
+            Directory where to write the cache files, by default ``data_dir``.
         """
 
         # download dataset if necessary
@@ -815,6 +895,8 @@ class DiffuserCamTestDataset(MeasuredDataset):
             lensless_fn="diffuser",
             lensed_fn="lensed",
             image_ext="npy",
+            cache=cache,
+            cache_dir=cache_dir,
         )
 
 
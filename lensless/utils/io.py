@@ -17,6 +17,14 @@ from lensless.hardware.constants import RPI_HQ_CAMERA_BLACK_LEVEL, RPI_HQ_CAMERA
 from lensless.utils.image import bayer2rgb_cc, print_image_info, resize, rgb2gray, get_max_val
 
 
+# downsampling factors for which JPEG images can be decoded at lower resolution, per (PIL) mode
+JPEG_REDUCED_FLAGS = {
+    2: {"L": cv2.IMREAD_REDUCED_GRAYSCALE_2, "RGB": cv2.IMREAD_REDUCED_COLOR_2},
+    4: {"L": cv2.IMREAD_REDUCED_GRAYSCALE_4, "RGB": cv2.IMREAD_REDUCED_COLOR_4},
+    8: {"L": cv2.IMREAD_REDUCED_GRAYSCALE_8, "RGB": cv2.IMREAD_REDUCED_COLOR_8},
+}
+
+
 def load_image(
     fp,
     verbose=False,
@@ -68,7 +76,8 @@ def load_image(
         Add depth and color dimensions if necessary so that image is 4D: (depth,
         height, width, color).
     downsample : int, optional
-        Downsampling factor. Recommended for image reconstruction.
+        Downsampling factor. Recommended for image reconstruction. For JPEG images and a factor of
+        2, 4, or 8, the image is directly decoded at the lower resolution.
     bg : array_like
         Background level to subtract.
     return_float : bool
@@ -120,6 +129,27 @@ def load_image(
         black_level = np.array(raw.black_level_per_channel[:3]).astype(np.float32)
     elif "npy" in fp or "npz" in fp:
         img = np.load(fp)
+    elif (
+        not bayer
+        and shape is None
+        and downsample in JPEG_REDUCED_FLAGS
+        and fp.lower().endswith((".jpg", ".jpeg"))
+    ):
+        with Image.open(fp) as im:
+            width, height = im.size
+            mode = im.mode
+        if mode in JPEG_REDUCED_FLAGS[downsample]:
+            # decode directly at lower resolution, and resize to same shape as full resolution
+            # decoding, which does not apply EXIF orientation
+            img = cv2.imread(
+                fp, JPEG_REDUCED_FLAGS[downsample][mode] | cv2.IMREAD_IGNORE_ORIENTATION
+            )
+            n_channels = 3 if mode == "RGB" else 1
+            shape = (int(height / downsample), int(width / downsample), n_channels)
+            downsample = None
+        else:
+            # e.g. CMYK
+            img = cv2.imread(fp, cv2.IMREAD_UNCHANGED)
     else:
         img = cv2.imread(fp, cv2.IMREAD_UNCHANGED)
 
@@ -134,10 +164,11 @@ def load_image(
 
         if back:
             back_img = cv2.imread(back, cv2.IMREAD_UNCHANGED)
-            dtype = img.dtype
-            img = img.astype(np.float32) - back_img.astype(np.float32)
-            img = np.clip(img, a_min=0, a_max=img.max())
-            img = img.astype(dtype)
+            bayer_dtype = img.dtype
+            # subtract and clip negative values without intermediate copies
+            img = np.subtract(img, back_img, dtype=np.float32)
+            np.maximum(img, 0, out=img)
+            img = img.astype(bayer_dtype)
         if nbits_out is None:
             nbits_out = nbits
 
@@ -303,7 +334,8 @@ def load_psf(
 
     original_dtype = psf.dtype
     max_val = get_max_val(psf)
-    psf = np.array(psf, dtype=dtype)
+    # loaded array is not shared, so no need to copy if already of the right type
+    psf = psf.astype(dtype, copy=False)
 
     if use_3d:
         if len(psf.shape) == 3:
@@ -322,29 +354,20 @@ def load_psf(
             grayscale = True
             psf = psf[np.newaxis, :, :, np.newaxis]
 
-    # check that all depths of the psf have the same shape.
-    for i in range(len(psf)):
-        assert psf[0].shape == psf[i].shape
-
     # subtract background, assume black edges
     if bg_pix is None:
         bg = np.zeros(len(np.shape(psf)))
 
     else:
-        # grayscale
-        if grayscale:
-            bg = np.mean(psf[:, bg_pix[0] : bg_pix[1], bg_pix[0] : bg_pix[1], :])
-            psf -= bg
-
-        # rgb
-        else:
-            bg = []
-            for i in range(psf.shape[3]):
-                bg_i = np.mean(psf[:, bg_pix[0] : bg_pix[1], bg_pix[0] : bg_pix[1], i])
-                psf[:, :, :, i] -= bg_i
-                bg.append(bg_i)
+        # single value for grayscale, one per channel for rgb
+        bg = np.mean(
+            psf[:, bg_pix[0] : bg_pix[1], bg_pix[0] : bg_pix[1], :],
+            axis=None if grayscale else (0, 1, 2),
+        )
+        psf -= bg
 
-        psf = np.clip(psf, a_min=0, a_max=psf.max())
+        # clip negative values, in-place to avoid a copy
+        np.maximum(psf, 0, out=psf)
         bg = np.array(bg)
 
     # resize
@@ -364,7 +387,7 @@ def load_psf(
     # normalize
     if return_float:
         # psf /= psf.max()
-        psf /= np.linalg.norm(psf.ravel())
+        psf /= np.linalg.norm(psf)
         bg /= max_val
     else:
         psf = psf.astype(original_dtype)
@@ -213,6 +213,8 @@ def benchmark_recon(config):
                 save_idx=config.save_idx,
                 output_dir=output_dir,
                 crop=crop,
+                num_workers=config.num_workers,
+                lpips_half_precision=config.lpips_half_precision,
             )
             results[model_name][int(n_iter)] = result
 
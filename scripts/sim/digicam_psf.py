@@ -4,14 +4,16 @@ import time
 import hydra
 import torch
 from hydra.utils import to_absolute_path
-import matplotlib.pyplot as plt
-from slm_controller import slm
 from lensless.utils.io import save_image, get_dtype, load_psf
 from lensless.utils.plot import plot_image
 from lensless.hardware.sensor import VirtualSensor
 from lensless.hardware.slm import get_programmable_mask, get_intensity_psf
 from waveprop.devices import slm_dict
 from waveprop.devices import SLMParam as SLMParam_wp
+import matplotlib
+
+matplotlib.use("Agg")  # only saving figures, avoid loading GUI backend
+import matplotlib.pyplot as plt  # noqa: E402
 
 
 @hydra.main(version_base=None, config_path="../../configs", config_name="sim_digicam_psf")
@@ -44,31 +46,30 @@ def digicam_psf(config):
     # pattern = np.random.rand(*pattern.shape) * 255
     # pattern = pattern.astype(np.uint8)
 
-    # -- apply aperture
-    aperture = np.zeros(pattern.shape, dtype=np.uint8)
-    top_left = np.array(ap_center) - np.array(ap_shape) // 2
-    bottom_right = top_left + np.array(ap_shape)
-    aperture[:, top_left[0] : bottom_right[0], top_left[1] : bottom_right[1]] = 1
-    pattern = pattern * aperture
-
     # -- extract aperture region
-    idx_1 = ap_center[0] - ap_shape[0] // 2
-    idx_2 = ap_center[1] - ap_shape[1] // 2
-
-    pattern_sub = pattern[
-        :,
-        idx_1 : idx_1 + ap_shape[0],
-        idx_2 : idx_2 + ap_shape[1],
-    ]
+    top_left = ap_center - ap_shape // 2
+    bottom_right = top_left + ap_shape
+    aperture_slice = (
+        slice(None),
+        slice(top_left[0], bottom_right[0]),
+        slice(top_left[1], bottom_right[1]),
+    )
+    pattern_sub = pattern[aperture_slice]
 
     print("Controllable region shape: ", pattern_sub.shape)
     print("Total number of pixels: ", np.prod(pattern_sub.shape))
 
-    # -- plot full
-    s = slm.create(config.digicam.slm)
-    s.set_preview(True)
-    s.imshow(pattern)
-    plt.savefig(os.path.join(output_folder, "pattern.png"))
+    # -- plot full (with aperture applied), requires SLM driver
+    if config.plot_full_pattern:
+        from slm_controller import slm
+
+        pattern_ap = np.zeros_like(pattern)
+        pattern_ap[aperture_slice] = pattern_sub
+
+        s = slm.create(config.digicam.slm)
+        s.set_preview(True)
+        s.imshow(pattern_ap)
+        plt.savefig(os.path.join(output_folder, "pattern.png"))
 
     # -- plot sub pattern
     plt.imshow(pattern_sub.transpose(1, 2, 0))
@@ -84,9 +85,7 @@ def digicam_psf(config):
     if SLMParam_wp.COLOR_FILTER in slm_param.keys():
         color_filter = slm_param[SLMParam_wp.COLOR_FILTER]
         if config.use_torch:
-            color_filter = torch.from_numpy(color_filter.copy()).to(
-                device=torch_device, dtype=dtype
-            )
+            color_filter = torch.as_tensor(color_filter, dtype=dtype, device=torch_device)
         else:
             color_filter = color_filter.astype(dtype)
 
@@ -112,26 +111,13 @@ def digicam_psf(config):
         color_filter=color_filter,
     )
 
-    if config.digicam.vertical_shift is not None:
+    # -- shift vertically and horizontally in one pass
+    shifts = (config.digicam.vertical_shift or 0, config.digicam.horizontal_shift or 0)
+    if any(shifts):
         if config.use_torch:
-            mask = torch.roll(mask, config.digicam.vertical_shift, dims=1)
+            mask = torch.roll(mask, shifts=shifts, dims=(1, 2))
         else:
-            mask = np.roll(mask, config.digicam.vertical_shift, axis=1)
-
-    if config.digicam.horizontal_shift is not None:
-        if config.use_torch:
-            mask = torch.roll(mask, config.digicam.horizontal_shift, dims=2)
-        else:
-            mask = np.roll(mask, config.digicam.horizontal_shift, axis=2)
-
-    # -- plot mask
-    if config.use_torch:
-        mask_np = mask.cpu().detach().numpy()
-    else:
-        mask_np = mask.copy()
-    mask_np = np.transpose(mask_np, (1, 2, 0))
-    plt.imshow(mask_np)
-    plt.savefig(os.path.join(output_folder, "mask.png"))
+            mask = np.roll(mask, shift=shifts, axis=(1, 2))
 
     # -- propagate to sensor
     psf_in = get_intensity_psf(
@@ -142,11 +128,24 @@ def digicam_psf(config):
         mask2sensor=mask2sensor,
     )
 
-    # -- plot PSF
+    # -- copy mask and PSF for plotting, with a single synchronization for GPU
     if config.use_torch:
-        psf_in_np = psf_in.cpu().detach().numpy()
+        mask_np = mask.detach().to("cpu", non_blocking=True)
+        psf_in_np = psf_in.detach().to("cpu", non_blocking=True)
+        if mask.is_cuda:
+            torch.cuda.synchronize(mask.device)
+        mask_np = mask_np.numpy()
+        psf_in_np = psf_in_np.numpy()
     else:
+        mask_np = mask.copy()
         psf_in_np = psf_in.copy()
+
+    # -- plot mask
+    mask_np = np.transpose(mask_np, (1, 2, 0))
+    plt.imshow(mask_np)
+    plt.savefig(os.path.join(output_folder, "mask.png"))
+
+    # -- plot PSF
     psf_in_np = np.transpose(psf_in_np, (1, 2, 0))
 
     # plot
@@ -166,23 +165,24 @@ def digicam_psf(config):
     ax.imshow(psf_in_np)
     ax.set_xticks([])
     ax.set_yticks([])
-    plt.savefig(fp)
+    fig.savefig(fp)
 
     if psf_meas is not None:
 
-        fig = plt.figure(frameon=False)
-        ax = plt.Axes(fig, [0.0, 0.0, 1.0, 1.0])
+        # normalize once for both plots
+        psf_meas_norm = psf_meas[0] / np.max(psf_meas)
+
+        # -- reuse figure of simulated PSF
+        ax.clear()
         ax.set_axis_off()
-        fig.add_axes(ax)
-        plot_image(psf_meas, gamma=config.digicam.gamma, normalize=True, ax=ax)
+        plot_image(psf_meas_norm, gamma=config.digicam.gamma, normalize=False, ax=ax)
         # remove axis values
         ax.set_xticks([])
         ax.set_yticks([])
-        plt.savefig(os.path.join(output_folder, "meas_psf_plot.png"))
+        fig.savefig(os.path.join(output_folder, "meas_psf_plot.png"))
 
         # plot overlayed
         fp = os.path.join(output_folder, "psf_overlay.png")
-        psf_meas_norm = psf_meas[0] / np.max(psf_meas)
         # psf_meas_norm = gamma_correction(psf_meas_norm, gamma=config.digicam.gamma)
         psf_in_np_norm = psf_in_np / np.max(psf_in_np)
 
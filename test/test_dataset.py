@@ -0,0 +1,37 @@
+import os
+import numpy as np
+import torch
+from lensless.utils.dataset import MeasuredDataset
+
+
+def _write_dataset(root_dir, n_files=3, shape=(8, 10, 3)):
+    rng = np.random.default_rng(0)
+    for folder in ["diffuser", "lensed"]:
+        os.makedirs(os.path.join(root_dir, folder))
+        for i in range(n_files):
+            img = rng.random(shape, dtype=np.float32)
+            np.save(os.path.join(root_dir, folder, f"im{i}.npy"), img)
+
+
+def test_measured_dataset_cache(tmp_path):
+    root_dir = str(tmp_path / "data")
+    cache_dir = str(tmp_path / "cache")
+    _write_dataset(root_dir)
+
+    dataset = MeasuredDataset(root_dir)
+    dataset_cached = MeasuredDataset(root_dir, cache=True, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 2
+    assert len(dataset) == len(dataset_cached)
+    for i in range(len(dataset)):
+        lensless, lensed = dataset[i]
+        lensless_cached, lensed_cached = dataset_cached[i]
+        assert torch.equal(lensless, lensless_cached)
+        assert torch.equal(lensed, lensed_cached)
+
+    # modified file should not be read from stale cache
+    new_img = np.zeros((8, 10, 3), dtype=np.float32)
+    np.save(os.path.join(root_dir, "lensed", "im0.npy"), new_img)
+    dataset_cached = MeasuredDataset(root_dir, cache=True, cache_dir=cache_dir)
+    _, lensed_cached = dataset_cached[0]
+    assert torch.equal(lensed_cached, MeasuredDataset(root_dir)[0][1])
+    assert not torch.any(lensed_cached)
@@ -1,4 +1,8 @@
-from lensless.utils.io import load_data, rgb2gray
+import os
+import cv2
+import numpy as np
+from PIL import Image
+from lensless.utils.io import load_data, load_image, rgb2gray
 
 psf_fp = "data/psf/tape_rgb.png"
 data_fp = "data/raw_data/thumbs_up_rgb.png"
@@ -50,6 +54,36 @@ def test_rgb2gray():
         assert len(data_gray.shape) == 3
 
 
+def test_load_image_downsample_jpeg(tmp_path):
+    jpeg_fp = os.path.join(tmp_path, "thumbs_up_rgb.jpg")
+    cv2.imwrite(jpeg_fp, cv2.imread(data_fp))
+    for ds in [2, 4, 8]:
+        img = load_image(jpeg_fp, downsample=ds, as_4d=True)
+        img_full = load_image(jpeg_fp, as_4d=True)
+        assert img.shape[1:3] == (int(img_full.shape[1] / ds), int(img_full.shape[2] / ds))
+        assert img.shape[3] == 3
+        assert img.dtype == img_full.dtype
+
+
+def test_load_image_downsample_jpeg_exif(tmp_path):
+    # EXIF orientation should be ignored, as when decoding at full resolution
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotate 90 degrees
+    img_pil = Image.open(data_fp).convert("RGB")
+    for mode, n_channels in [("RGB", 3), ("L", 1)]:
+        jpeg_fp = os.path.join(tmp_path, f"thumbs_up_exif_{mode}.jpg")
+        img_pil.convert(mode).save(jpeg_fp, exif=exif.tobytes(), quality=95)
+        width, height = img_pil.size
+        for ds in [2, 4, 8]:
+            img = load_image(jpeg_fp, downsample=ds, as_4d=True)
+            # full resolution decoding then resizing
+            shape = (int(height / ds), int(width / ds), n_channels)
+            img_ref = load_image(jpeg_fp, shape=shape, as_4d=True)
+            assert img.shape == img_ref.shape
+            assert img.dtype == img_ref.dtype
+            assert np.abs(img.astype(np.float32) - img_ref).max() <= 4
+
+
 if __name__ == "__main__":
     test_load_data()
     test_rgb2gray()
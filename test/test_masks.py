@@ -1,8 +1,15 @@
 import numpy as np
+import torch
+from scipy import ndimage
 from lensless.hardware.mask import CodedAperture, PhaseContour, FresnelZoneAperture
+from lensless.hardware.sensor import VirtualSensor
+from lensless.hardware.slm import get_programmable_mask, _angular_spectrum_batch
 from lensless.eval.metric import mse, psnr, ssim
 from waveprop.fresnel import fresnel_conv
-
+from waveprop.devices import slm_dict, SLMParam
+from waveprop.slm import get_centers
+from waveprop.rs import angular_spectrum
+from waveprop.color import ColorSystem
 
 resolution = np.array([380, 507])
 d1 = 3e-6
@@ -92,8 +99,116 @@ def test_classmethod():
     assert np.all(mask3.psf.shape == desired_psf_shape)
 
 
+def _programmable_mask_loop(vals, sensor, slm_param, flipud=False):
+    """
+    Reference for :py:func:`~lensless.hardware.slm.get_programmable_mask`, setting each cell in a loop.
+    """
+    n_color_filter = np.prod(slm_param[SLMParam.COLOR_FILTER].shape[:2])
+    color_filter = slm_param[SLMParam.COLOR_FILTER]
+    if flipud:
+        color_filter = np.flipud(color_filter)
+    centers = get_centers(vals.shape, pixel_pitch=slm_param[SLMParam.PITCH])
+    _height_pixel, _width_pixel = (slm_param[SLMParam.CELL_SIZE] / sensor.pitch).astype(int)
+
+    if isinstance(vals, torch.Tensor):
+        color_filter = torch.tensor(color_filter.copy()).to(vals)
+        mask = torch.zeros((n_color_filter,) + tuple(sensor.resolution)).to(vals)
+    else:
+        mask = np.zeros((n_color_filter,) + tuple(sensor.resolution), dtype=vals.dtype)
+    vals_flat = vals.reshape(-1)
+
+    for i, _center in enumerate(centers):
+        _center_pixel = (_center / sensor.pitch + sensor.resolution / 2).astype(int)
+        top = _center_pixel[0] - np.floor(_height_pixel / 2).astype(int)
+        left = _center_pixel[1] + 1 - np.floor(_width_pixel / 2).astype(int)
+        mask_val = vals_flat[i] * color_filter[i // vals.shape[1] % n_color_filter][0]
+        mask[:, top : top + _height_pixel, left : left + _width_pixel] = mask_val[:, None, None]
+    return mask
+
+
+def test_programmable_mask():
+
+    sensor = VirtualSensor.from_name("rpi_hq", downsample=8)
+    slm_param = slm_dict["adafruit"]
+    rng = np.random.default_rng(0)
+
+    # pattern inside sensor, and larger than sensor (cells partially or fully outside)
+    for shape in [(18, 12), (90, 40)]:
+        vals = rng.random(shape).astype(np.float32)
+        for flipud in [False, True]:
+            mask = get_programmable_mask(vals, sensor, slm_param, flipud=flipud)
+            mask_ref = _programmable_mask_loop(vals, sensor, slm_param, flipud=flipud)
+            assert mask.dtype == mask_ref.dtype
+            np.testing.assert_array_equal(mask, mask_ref)
+
+            # torch, with gradient
+            vals_torch = torch.tensor(vals, requires_grad=True)
+            mask = get_programmable_mask(vals_torch, sensor, slm_param, flipud=flipud)
+            (grad,) = torch.autograd.grad(mask.square().sum(), vals_torch)
+            vals_torch = torch.tensor(vals, requires_grad=True)
+            mask_ref = _programmable_mask_loop(vals_torch, sensor, slm_param, flipud=flipud)
+            (grad_ref,) = torch.autograd.grad(mask_ref.square().sum(), vals_torch)
+            assert torch.equal(mask.detach(), mask_ref.detach())
+            assert torch.allclose(grad, grad_ref, rtol=1e-5)
+
+
+def test_angular_spectrum_batch():
+
+    wv = ColorSystem.rgb().wv
+    pitch = np.array([d1, d1])
+    rng = np.random.default_rng(0)
+
+    for shape in [(64, 96), (63, 95)]:
+        u_in = rng.random((len(wv),) + shape).astype(np.float32)
+        u_in_torch = torch.tensor(u_in)
+
+        # numpy, torch, and torch with distance as tensor (transfer functions not cached)
+        for _u_in, _dz, device in [
+            (u_in, dz, None),
+            (u_in_torch, dz, "cpu"),
+            (u_in_torch, torch.tensor([dz]), "cpu"),
+        ]:
+            u_out = _angular_spectrum_batch(
+                _u_in, wv=wv, d1=pitch, dz=_dz, dtype=_u_in.dtype, device=device
+            )
+            assert u_out.shape == u_in.shape
+            for i, _wv in enumerate(wv):
+                u_out_ref, _, _ = angular_spectrum(
+                    u_in=_u_in[i], wv=_wv, d1=pitch, dz=_dz, dtype=_u_in.dtype, device=device
+                )
+                if isinstance(u_out_ref, torch.Tensor):
+                    u_out_ref = u_out_ref.numpy()
+                    _u_out = u_out[i].numpy()
+                else:
+                    _u_out = u_out[i]
+                np.testing.assert_allclose(_u_out, u_out_ref, atol=1e-5)
+
+
+def test_programmable_mask_rotate():
+
+    sensor = VirtualSensor.from_name("rpi_hq", downsample=8)
+    slm_param = slm_dict["adafruit"]
+    vals = np.random.default_rng(0).random((30, 40)).astype(np.float32)
+    mask = get_programmable_mask(vals, sensor, slm_param)
+
+    for angle in [10, -25]:
+        mask_rot = get_programmable_mask(vals, sensor, slm_param, rotate=angle)
+        mask_ref = ndimage.rotate(mask, axes=(2, 1), angle=angle, reshape=False)
+        assert mask_rot.shape == mask_ref.shape
+
+        # ignore pixels along the border of the rotated mask, where OpenCV interpolates with zeros
+        # outside the mask but SciPy doesn't
+        interior = ndimage.rotate(np.ones(mask.shape[1:]), angle=angle, reshape=False, order=0)
+        interior = ndimage.binary_erosion(interior, iterations=3)
+        # bicubic interpolation (OpenCV) vs cubic spline (SciPy)
+        np.testing.assert_allclose(mask_rot[:, interior], mask_ref[:, interior], atol=0.1)
+
+
 if __name__ == "__main__":
     test_flatcam()
     test_phlatcam()
     test_fza()
     test_classmethod()
+    test_programmable_mask()
+    test_angular_spectrum_batch()
+    test_programmable_mask_rotate()
@@ -0,0 +1,86 @@
+import os
+import fnmatch
+import pytest
+from lensless.recon import model_dict
+from lensless.recon.model_dict import download_model, DOWNLOAD_MARKER
+
+camera = "diffusercam"
+dataset = "mirflickr"
+model = "U20"
+
+# files of a model repository on Hugging Face
+repo_files = [".hydra/config.yaml", "recon_epochBEST", "psf_epochBEST.npy", "recon_epoch0"]
+
+
+@pytest.fixture
+def downloads(monkeypatch):
+    """
+    Replace download from Hugging Face, recording the patterns of each call.
+    """
+    calls = []
+
+    def fake_snapshot_download(repo_id, local_dir, allow_patterns=None):
+        calls.append(allow_patterns)
+        for fn in repo_files:
+            if allow_patterns is None or any(fnmatch.fnmatch(fn, p) for p in allow_patterns):
+                fp = os.path.join(local_dir, fn)
+                os.makedirs(os.path.dirname(fp), exist_ok=True)
+                open(fp, "w").close()
+        return local_dir
+
+    monkeypatch.setattr(model_dict, "snapshot_download", fake_snapshot_download)
+    return calls
+
+
+def test_download_model(tmp_path, downloads):
+    model_dir = download_model(camera, dataset, model, local_model_dir=str(tmp_path))
+    assert len(downloads) == 1
+    assert os.path.exists(os.path.join(model_dir, "recon_epochBEST"))
+    assert not os.path.exists(os.path.join(model_dir, "recon_epoch0"))
+
+    # skip if already downloaded, also for narrower patterns
+    download_model(camera, dataset, model, local_model_dir=str(tmp_path))
+    download_model(
+        camera, dataset, model, local_model_dir=str(tmp_path), allow_patterns=(".hydra/*",)
+    )
+    assert len(downloads) == 1
+
+    # download again for broader patterns
+    download_model(
+        camera,
+        dataset,
+        model,
+        local_model_dir=str(tmp_path),
+        allow_patterns=(".hydra/*", "*epochBEST*", "*epoch0"),
+    )
+    assert len(downloads) == 2
+    assert os.path.exists(os.path.join(model_dir, "recon_epoch0"))
+
+    # download whole folder, then never again
+    download_model(camera, dataset, model, local_model_dir=str(tmp_path), allow_patterns=None)
+    assert downloads[-1] is None
+    download_model(camera, dataset, model, local_model_dir=str(tmp_path))
+    download_model(camera, dataset, model, local_model_dir=str(tmp_path), allow_patterns=None)
+    assert len(downloads) == 3
+
+
+def test_download_model_invalid_marker(tmp_path, downloads):
+    model_dir = download_model(camera, dataset, model, local_model_dir=str(tmp_path))
+    with open(os.path.join(model_dir, DOWNLOAD_MARKER), "w") as f:
+        f.write("not json")
+    download_model(camera, dataset, model, local_model_dir=str(tmp_path))
+    assert len(downloads) == 2
+
+
+def test_download_model_incomplete(tmp_path, monkeypatch):
+    # e.g. no connection, existing partial directory is returned
+    def offline_snapshot_download(repo_id, local_dir, allow_patterns=None):
+        os.makedirs(os.path.join(local_dir, ".hydra"), exist_ok=True)
+        open(os.path.join(local_dir, ".hydra", "config.yaml"), "w").close()
+        return local_dir
+
+    monkeypatch.setattr(model_dict, "snapshot_download", offline_snapshot_download)
+    with pytest.raises(FileNotFoundError):
+        download_model(camera, dataset, model, local_model_dir=str(tmp_path))
+    model_dir = os.path.join(str(tmp_path), camera, dataset, model)
+    assert not os.path.exists(os.path.join(model_dir, DOWNLOAD_MARKER))